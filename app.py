@@ -1,107 +1,147 @@
 import os
 import time
-import json
+import atexit
+import functools
 import logging
-import hashlib
+import logging.handlers
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from dataclasses import dataclass
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import requests
-from flask import Flask, render_template, request, redirect, url_for, flash
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session
+from jinja2 import FileSystemBytecodeCache
 from dotenv import load_dotenv
 
+# The cache layer lives in its own fully-typed module so it can be compiled
+# with mypyc; see cache.py.
+import cache as weather_cache
+from cache import json_loads, read_cache, write_cache
+
 # Load environment variables
 load_dotenv()
 
-# Read config
-with open("config.json", "r", encoding="utf-8") as f:
-    CONFIG = json.load(f)
+# Read config once at import and freeze it. Attribute access on a frozen
+# slots dataclass is a C-level descriptor lookup, cheaper than dict.get,
+# and defaults live in one place instead of at every call site.
+@dataclass(frozen=True, slots=True)
+class Config:
+    API_URL: str = "https://api.openweathermap.org/data/2.5/weather"
+    CACHE_TTL: int = 1800
+    CACHE_DIR: str = "cache"
+    LOG_FILE: str = "logs/app.log"
+    UNITS: str = "metric"
+    LANG: str = "en"
+    MAX_RETRIES: int = 3
+    BACKOFF_BASE: int = 1
+    API_RATE_LIMIT: int = 10  # upstream calls per second
+    MAX_CONCURRENT_FETCHES: int = 16
+    GROUP_API_URL: str = "https://api.openweathermap.org/data/2.5/group"
+    BATCH_WINDOW_MS: int = 50
+    BATCH_MAX: int = 20  # group endpoint accepts at most 20 city IDs
+
+
+CFG = Config(**json_loads(Path("config.json").read_bytes()))
+
+CACHE_DIR = Path(CFG.CACHE_DIR)
+LOG_FILE = Path(CFG.LOG_FILE)
 
-API_URL = CONFIG.get("API_URL")
-CACHE_TTL = CONFIG.get("CACHE_TTL", 1800)
-CACHE_DIR = Path(CONFIG.get("CACHE_DIR", "cache"))
-LOG_FILE = Path(CONFIG.get("LOG_FILE", "logs/app.log"))
-UNITS = CONFIG.get("UNITS", "metric")
-LANG = CONFIG.get("LANG", "en")
-MAX_RETRIES = CONFIG.get("MAX_RETRIES", 3)
-BACKOFF_BASE = CONFIG.get("BACKOFF_BASE", 1)
+weather_cache.configure(CACHE_DIR, CFG.CACHE_TTL)
 
 API_KEY = os.getenv("API_KEY")
 
+# One shared Session so upstream calls reuse pooled keep-alive connections
+# instead of paying a fresh TCP + TLS handshake per request.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=0)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
 # Ensure directories exist
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-# Configure logging
-logging.basicConfig(
-    filename=str(LOG_FILE),
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
+# Configure logging. Request threads only enqueue records; a background
+# QueueListener thread owns the FileHandler and does the actual disk writes,
+# so request handling never blocks on log I/O.
+_log_queue = queue.SimpleQueue()
+_file_handler = logging.FileHandler(str(LOG_FILE))
+_file_handler.setFormatter(logging.Formatter(
+    "%(asctime)s | %(levelname)s | %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S"
+))
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _file_handler, respect_handler_level=False
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET", "dev-secret")  # ok for development
 
-# Jinja filter to format unix timestamps
+# Templates don't change at runtime: skip the per-render mtime stat() and
+# persist compiled template bytecode across process restarts.
+app.jinja_env.auto_reload = False
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
+# Jinja filter to format unix timestamps. Weather payloads repeat the same
+# timestamps, so the formatting is memoized on the integer value.
+@functools.lru_cache(maxsize=4096)
+def _format_timestamp(ts: int) -> str:
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+
+
 @app.template_filter('datetimeformat')
 def datetimeformat_filter(value):
     try:
-        return datetime.fromtimestamp(int(value)).strftime('%Y-%m-%d %H:%M:%S')
+        return _format_timestamp(int(value))
     except Exception:
         return value
 
 
-def slugify(text: str) -> str:
-    """Convert city name to a safe filename (hash for safety)."""
-    text = text.strip().lower()
-    h = hashlib.md5(text.encode("utf-8")).hexdigest()
-    return f"{text.replace(' ', '_')}_{h}"
+def log_request(city: str, status: int, source: str, note: str = ""):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"City:{city} | Status:{status} | Source:{source} | Note:{note}")
 
 
-def cache_path_for(city: str) -> Path:
-    return CACHE_DIR / f"{slugify(city)}.json"
+class TokenBucket:
+    """Simple thread-safe token bucket: at most `rate` acquisitions per second."""
 
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
 
-def read_cache(city: str):
-    """Read cached data for a city.
-    Returns:
-      None if no cache,
-      {"expired": True, ...} if cache exists but expired,
-      cache dict if valid.
-    """
-    p = cache_path_for(city)
-    if not p.exists():
-        return None
-    try:
-        with p.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        ts = data.get("timestamp", 0)
-        if time.time() - ts <= CACHE_TTL:
-            return data
-        else:
-            # expired: return it annotated so caller can fallback to it
-            return {"expired": True, **data}
-    except Exception as e:
-        logging.error(f"Failed reading cache for {city}: {e}")
-        return None
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 
-def write_cache(city: str, payload: dict):
-    """Write payload to cache for city."""
-    p = cache_path_for(city)
-    try:
-        payload_to_store = {
-            "timestamp": time.time(),
-            "data": payload
-        }
-        with p.open("w", encoding="utf-8") as f:
-            json.dump(payload_to_store, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logging.error(f"Failed writing cache for {city}: {e}")
-
-
-def log_request(city: str, status: int, source: str, note: str = ""):
-    logging.info(f"City:{city} | Status:{status} | Source:{source} | Note:{note}")
+# Bound upstream pressure: a token bucket honors the provider's rate limit and
+# a semaphore caps how many worker threads can block on the network at once.
+_API_BUCKET = TokenBucket(CFG.API_RATE_LIMIT)
+_FETCH_SEMAPHORE = threading.BoundedSemaphore(CFG.MAX_CONCURRENT_FETCHES)
 
 
 def fetch_weather_from_api(city: str):
@@ -112,26 +152,33 @@ def fetch_weather_from_api(city: str):
     params = {
         "q": city,
         "appid": API_KEY,
-        "units": UNITS,
-        "lang": LANG
+        "units": CFG.UNITS,
+        "lang": CFG.LANG
     }
     attempt = 0
-    while attempt < MAX_RETRIES:
+    while attempt < CFG.MAX_RETRIES:
         try:
-            resp = requests.get(API_URL, params=params, timeout=10)
+            _API_BUCKET.acquire()
+            with _FETCH_SEMAPHORE:
+                resp = SESSION.get(CFG.API_URL, params=params, timeout=10)
             # If 429, consider Retry-After header
             if resp.status_code == 429:
                 retry_after = resp.headers.get("Retry-After")
                 note = f"429 Too Many Requests. Retry-After={retry_after}"
                 log_request(city, resp.status_code, "API", note)
-                if retry_after:
+                if retry_after and retry_after.isdigit():
+                    # Fast path: delta-seconds form, no exception machinery
+                    wait = int(retry_after)
+                elif retry_after:
+                    # HTTP-date form
                     try:
-                        wait = int(retry_after)
-                    except ValueError:
-                        wait = BACKOFF_BASE * (2 ** attempt)
-                    time.sleep(wait)
+                        retry_at = parsedate_to_datetime(retry_after)
+                        wait = max(0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+                    except (TypeError, ValueError):
+                        wait = CFG.BACKOFF_BASE * (1 << attempt)
                 else:
-                    time.sleep(BACKOFF_BASE * (2 ** attempt))
+                    wait = CFG.BACKOFF_BASE * (1 << attempt)
+                time.sleep(wait)
                 attempt += 1
                 continue
             # For other statuses, return the response object for handling
@@ -140,34 +187,219 @@ def fetch_weather_from_api(city: str):
             # Network error or timeout
             note = f"RequestException: {e}"
             log_request(city, 0, "API", note)
-            time.sleep(BACKOFF_BASE * (2 ** attempt))
+            time.sleep(CFG.BACKOFF_BASE * (1 << attempt))
             attempt += 1
     # Exhausted retries
     return None
 
 
+# City name -> OpenWeatherMap city ID, learned from earlier payloads. The
+# /group endpoint only accepts numeric IDs, so batching is possible once a
+# city has been fetched by name at least once.
+_CITY_IDS: "dict[str, int]" = {}
+_CITY_IDS_LOCK = threading.Lock()
+
+
+def _remember_city_id(city: str, city_id):
+    if isinstance(city_id, int):
+        with _CITY_IDS_LOCK:
+            _CITY_IDS[city.lower()] = city_id
+
+
+class BatchFetcher:
+    """Coalesce concurrent by-ID fetches into single /group upstream calls.
+
+    Cache misses for cities with known IDs are queued; a background thread
+    collects them for up to BATCH_WINDOW_MS (or BATCH_MAX cities) and issues
+    one group request, resolving each caller's Future with its payload.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def fetch(self, city_id: int, timeout: float = 15):
+        """Return the parsed payload for city_id, or None on failure."""
+        self._ensure_thread()
+        fut = Future()
+        self._queue.put((city_id, fut))
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            cid, fut = self._queue.get()
+            batch = {cid: [fut]}
+            deadline = time.monotonic() + CFG.BATCH_WINDOW_MS / 1000
+            while len(batch) < CFG.BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    cid, fut = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.setdefault(cid, []).append(fut)
+            self._flush(batch)
+
+    def _flush(self, batch: "dict[int, list[Future]]"):
+        params = {
+            "id": ",".join(str(cid) for cid in batch),
+            "appid": API_KEY,
+            "units": CFG.UNITS,
+            "lang": CFG.LANG
+        }
+        payloads = {}
+        try:
+            _API_BUCKET.acquire()
+            with _FETCH_SEMAPHORE:
+                resp = SESSION.get(CFG.GROUP_API_URL, params=params, timeout=10)
+            if resp.status_code == 200:
+                for item in json_loads(resp.content).get("list", []):
+                    payloads[item.get("id")] = item
+            else:
+                log_request("batch", resp.status_code, "API",
+                            f"group request failed for {len(batch)} cities")
+        except Exception as e:
+            log_request("batch", 0, "API", f"group request error: {e}")
+        # Unresolved cities get None; callers fall back to the solo fetch.
+        for cid, futs in batch.items():
+            payload = payloads.get(cid)
+            for fut in futs:
+                fut.set_result(payload)
+
+
+_BATCHER = BatchFetcher()
+
+
+def fetch_weather(city: str):
+    """Fetch weather for a city, batching with other concurrent misses.
+
+    Returns a parsed payload dict when served by the batch endpoint, otherwise
+    the raw Response (or None) from fetch_weather_from_api.
+    """
+    city_id = _CITY_IDS.get(city.lower())
+    if city_id is not None:
+        payload = _BATCHER.fetch(city_id)
+        if payload is not None:
+            return payload
+    return fetch_weather_from_api(city)
+
+
+# Single-flight registry: at most one upstream fetch per city at a time.
+_INFLIGHT: "dict[str, Future]" = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def fetch_weather_single_flight(city: str):
+    """Coalesce concurrent cache-miss fetches for the same city.
+
+    When N requests miss the cache for one city simultaneously (e.g. right
+    after expiry), only the first actually calls the API; the rest wait on
+    its Future and share the response.
+    """
+    key = city.lower()
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        leader = fut is None
+        if leader:
+            fut = Future()
+            _INFLIGHT[key] = fut
+    if not leader:
+        try:
+            return fut.result(timeout=15)
+        except FutureTimeout:
+            return None
+    try:
+        resp = fetch_weather(city)
+        fut.set_result(resp)
+        return resp
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
+
+# Pre-rendered response bodies for the cache-hit branch, keyed by
+# (city, timestamp). The rendered page is a pure function of these, so repeat
+# views of a fresh cache entry can skip Jinja entirely.
+RESP_CACHE_MAX = 256
+_RESP_CACHE: "OrderedDict[tuple[str, int], bytes]" = OrderedDict()
+_RESP_CACHE_LOCK = threading.Lock()
+
+
+def _resp_cache_get(key: "tuple[str, int]"):
+    if time.time() - key[1] > CFG.CACHE_TTL:
+        return None
+    with _RESP_CACHE_LOCK:
+        body = _RESP_CACHE.get(key)
+        if body is not None:
+            _RESP_CACHE.move_to_end(key)
+        return body
+
+
+def _resp_cache_put(key: "tuple[str, int]", body: bytes):
+    with _RESP_CACHE_LOCK:
+        _RESP_CACHE[key] = body
+        _RESP_CACHE.move_to_end(key)
+        while len(_RESP_CACHE) > RESP_CACHE_MAX:
+            _RESP_CACHE.popitem(last=False)
+
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
 
 
+# url_for walks the routing map and rebuilds the string on every call; the
+# index URL never changes, so resolve it once for the redirect-heavy
+# error branches below.
+with app.test_request_context():
+    INDEX_URL = url_for("index")
+
+
 @app.route("/weather", methods=["POST"])
 def weather():
     city = request.form.get("city", "").strip()
     if not city:
         flash("Please enter a city name.", "warning")
-        return redirect(url_for("index"))
+        return redirect(INDEX_URL)
 
     # 1. Check cache
     cache = read_cache(city)
+    if cache:
+        # Even an expired entry carries the city ID needed for batched refreshes.
+        _remember_city_id(city, cache.get("data", {}).get("id"))
     if cache and not cache.get("expired"):
         log_request(city, 200, "Cache", "served from cache")
         data = cache.get("data")
         ts = cache.get("timestamp", time.time())
-        return render_template("index.html", weather=data, city=city, source="cache", cached_time=ts)
+        # Reuse the rendered body for repeat views of the same cache entry.
+        # Skipped when a flash is pending, since the page would differ.
+        key = (city.lower(), int(ts))
+        cacheable = "_flashes" not in session
+        if cacheable:
+            body = _resp_cache_get(key)
+            if body is not None:
+                return Response(body, mimetype="text/html")
+        html = render_template("index.html", weather=data, city=city, source="cache", cached_time=ts)
+        if cacheable:
+            _resp_cache_put(key, html.encode("utf-8"))
+        return html
 
-    # 2. Try API
-    resp = fetch_weather_from_api(city)
+    # 2. Try API (coalesced with any in-flight fetch for the same city)
+    resp = fetch_weather_single_flight(city)
     if resp is None:
         # Network/backoff exhausted — fallback to cache (even if expired)
         if cache:
@@ -183,7 +415,14 @@ def weather():
             )
         else:
             flash("Service is unreachable and no cached data is available.", "danger")
-            return redirect(url_for("index"))
+            return redirect(INDEX_URL)
+
+    # Batched fetches return the parsed payload directly
+    if isinstance(resp, dict):
+        _remember_city_id(city, resp.get("id"))
+        write_cache(city, resp)
+        log_request(city, 200, "API", "fetched via batch and cached")
+        return render_template("index.html", weather=resp, city=city, source="api", cached_time=time.time())
 
     # If we have an HTTP response object
     try:
@@ -193,22 +432,25 @@ def weather():
 
     if status == 200:
         try:
-            payload = resp.json()
+            # Parse the raw bytes directly; resp.json() would first decode to
+            # str and then run stdlib json over it.
+            payload = json_loads(resp.content)
+            _remember_city_id(city, payload.get("id"))
             write_cache(city, payload)
             log_request(city, 200, "API", "fetched and cached")
             return render_template("index.html", weather=payload, city=city, source="api", cached_time=time.time())
         except Exception as e:
-            logging.error(f"Failed parsing JSON for {city}: {e}")
+            logger.error(f"Failed parsing JSON for {city}: {e}")
             flash("Error processing the received data.", "danger")
-            return redirect(url_for("index"))
+            return redirect(INDEX_URL)
     elif status == 401:
         log_request(city, 401, "API", "invalid api key")
         flash("Invalid API key. Please check your configuration.", "danger")
-        return redirect(url_for("index"))
+        return redirect(INDEX_URL)
     elif status == 404:
         log_request(city, 404, "API", "city not found")
         flash("City not found. Please check the city name.", "warning")
-        return redirect(url_for("index"))
+        return redirect(INDEX_URL)
     elif status == 429:
         log_request(city, 429, "API", "rate limited")
         if cache:
@@ -223,7 +465,7 @@ def weather():
             )
         else:
             flash("Rate limit reached and no cached data is available.", "danger")
-            return redirect(url_for("index"))
+            return redirect(INDEX_URL)
     elif 500 <= status < 600:
         log_request(city, status, "API", "server error")
         if cache:
@@ -238,11 +480,11 @@ def weather():
             )
         else:
             flash("Server error occurred and no cached data is available.", "danger")
-            return redirect(url_for("index"))
+            return redirect(INDEX_URL)
     else:
         log_request(city, status, "API", "other error")
         flash(f"Error fetching data: HTTP {status}", "danger")
-        return redirect(url_for("index"))
+        return redirect(INDEX_URL)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+"""Disk and in-memory cache helpers for the weather app.
+
+Kept free of Flask imports and fully type-annotated so the whole module can
+be compiled with mypyc (``mypyc cache.py``) for an extra speedup on the
+per-request hot path; the Flask views stay pure Python and just call in.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# Prefer orjson (C implementation) for the cache serialization hot path;
+# fall back to stdlib json when it is not installed.
+try:
+    import orjson
+
+    def json_loads(raw: bytes) -> dict:
+        return orjson.loads(raw)
+
+    def json_dumps(obj: dict) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def json_loads(raw: bytes) -> dict:
+        return json.loads(raw)
+
+    def json_dumps(obj: dict) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+# Compress cache files with LZ4 when available: weather JSON shrinks several
+# times over and decompression is cheaper than reading the extra bytes cold.
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+_LZ4_MAGIC = b'\x04"M\x18'  # LZ4 frame magic number
+
+logger = logging.getLogger(__name__)
+
+# Defaults; the app overrides these from its config via configure().
+CACHE_DIR: Path = Path("cache")
+CACHE_TTL: int = 1800
+
+
+def configure(cache_dir: Path, ttl: int) -> None:
+    """Point the cache at the app's configured directory and TTL."""
+    global CACHE_DIR, CACHE_TTL
+    CACHE_DIR = cache_dir
+    CACHE_TTL = ttl
+
+
+# Lowercase and space->underscore in a single C-level pass for ASCII names.
+_SLUG_TRANS = str.maketrans(
+    {chr(c): chr(c + 32) for c in range(ord('A'), ord('Z') + 1)} | {' ': '_'}
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def slugify(text: str) -> str:
+    """Convert city name to a safe filename (hash for safety).
+
+    Memoized since the same cities are requested repeatedly; blake2b with an
+    8-byte digest is faster than md5 for short inputs and keeps filenames short.
+    """
+    text = text.strip()
+    if text.isascii():
+        # Common case: one translate() instead of two allocating passes.
+        text = text.translate(_SLUG_TRANS)
+    else:
+        text = text.lower().replace(' ', '_')
+    h = hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+    return f"{text}_{h}"
+
+
+def cache_path_for(city: str) -> Path:
+    return CACHE_DIR / f"{slugify(city)}.json"
+
+
+# In-memory cache in front of the disk cache: city -> (timestamp, stored payload).
+# Bounded LRU so long-running processes don't grow without limit.
+MEM_CACHE_MAX = 1024
+_MEM_CACHE: "OrderedDict[str, tuple[int, dict]]" = OrderedDict()
+_MEM_CACHE_LOCK = threading.RLock()
+
+
+def _mem_cache_get(city: str) -> Optional[dict]:
+    """Return the stored payload for city if present and fresh, else None."""
+    key = city.lower()
+    with _MEM_CACHE_LOCK:
+        entry = _MEM_CACHE.get(key)
+        if entry is None:
+            return None
+        ts, stored = entry
+        if int(time.time()) - ts <= CACHE_TTL:
+            _MEM_CACHE.move_to_end(key)
+            return stored
+        # Expired: drop it and fall back to disk.
+        del _MEM_CACHE[key]
+        return None
+
+
+def _mem_cache_put(city: str, ts: int, stored: dict) -> None:
+    key = city.lower()
+    with _MEM_CACHE_LOCK:
+        _MEM_CACHE[key] = (ts, stored)
+        _MEM_CACHE.move_to_end(key)
+        while len(_MEM_CACHE) > MEM_CACHE_MAX:
+            _MEM_CACHE.popitem(last=False)
+
+
+def read_cache(city: str) -> Optional[dict]:
+    """Read cached data for a city.
+    Returns:
+      None if no cache,
+      {"expired": True, ...} if cache exists but expired,
+      cache dict if valid.
+    """
+    # Fast path: fresh entry already in memory, no file I/O or JSON parse.
+    stored = _mem_cache_get(city)
+    if stored is not None:
+        return stored
+
+    p = cache_path_for(city)
+    try:
+        # Single open()/read()/close(); a missing file is the normal miss
+        # case, so catch it instead of paying a separate exists() stat.
+        raw = p.read_bytes()
+    except FileNotFoundError:
+        return None
+    try:
+        # Entries written before compression was enabled are plain JSON.
+        if lz4 is not None and raw[:4] == _LZ4_MAGIC:
+            raw = lz4.frame.decompress(raw)
+        data = json_loads(raw)
+        ts = data.get("timestamp", 0)
+        if int(time.time()) - ts <= CACHE_TTL:
+            _mem_cache_put(city, ts, data)
+            return data
+        else:
+            # expired: return it annotated so caller can fallback to it
+            return {"expired": True, **data}
+    except Exception as e:
+        logger.error(f"Failed reading cache for {city}: {e}")
+        return None
+
+
+def write_cache(city: str, payload: dict) -> None:
+    """Write payload to cache for city."""
+    p = cache_path_for(city)
+    try:
+        payload_to_store = {
+            "timestamp": int(time.time()),
+            "data": payload
+        }
+        # Write to a temp file and rename so readers never see a partial file.
+        raw = json_dumps(payload_to_store)
+        if lz4 is not None:
+            raw = lz4.frame.compress(raw)
+        tmp = p.with_suffix(".json.tmp")
+        tmp.write_bytes(raw)
+        os.replace(tmp, p)
+        _mem_cache_put(city, payload_to_store["timestamp"], payload_to_store)
+    except Exception as e:
+        logger.error(f"Failed writing cache for {city}: {e}")